@@ -74,6 +74,26 @@ def test_tdmodule_dispatch(benchmark):
     )
 
 
+def make_tdmodule_linear():
+    return (
+        (
+            TensorDictModule(nn.Linear(3, 4), in_keys=["in"], out_keys=["out"]),
+            TensorDict({"in": torch.randn(3, 3)}, [3]),
+        ),
+        {},
+    )
+
+
+def test_tdmodule_linear(benchmark):
+    benchmark.pedantic(
+        lambda net, td: net(td),
+        setup=make_tdmodule_linear,
+        iterations=1,
+        rounds=10_000,
+        warmup_rounds=1000,
+    )
+
+
 def make_tdseq():
     class MyModule(TensorDictModuleBase):
         in_keys = ["x"]
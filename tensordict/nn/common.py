@@ -306,22 +306,16 @@ class _OutKeysSelect:
         self._init(module)
         if is_dispatched:
             # it might be the case that dispatch was not aware of what the out-keys were.
+            mask = module._get_out_keys_mask()
             if isinstance(tensordict_out, tuple):
                 out = tuple(
-                    item
-                    for i, item in enumerate(tensordict_out)
-                    if module._out_keys[i] in module.out_keys
+                    item for i, item in enumerate(tensordict_out) if mask >> i & 1
                 )
                 if len(out) == 1:
                     return out[0]
                 return out
-            elif module._out_keys[0] in module.out_keys and len(module._out_keys) == 1:
-                return tensordict_out
-            elif (
-                module._out_keys[0] not in module.out_keys
-                and len(module._out_keys) == 1
-            ):
-                return ()
+            elif len(module._out_keys) == 1:
+                return tensordict_out if mask & 1 else ()
             else:
                 raise RuntimeError(
                     f"Selecting out-keys failed. Original out_keys: {module._out_keys}, selected: {module.out_keys}."
@@ -376,6 +370,9 @@ class TensorDictModuleBase(nn.Module):
 
     """
 
+    # bitmask of the selected out_keys, computed lazily from out_keys
+    _out_keys_mask = None
+
     def __new__(cls, *args, **kwargs):
         # check the out_keys and in_keys in the dict
         if "in_keys" in cls.__dict__ and not isinstance(
@@ -420,6 +417,18 @@ class TensorDictModuleBase(nn.Module):
         if not hasattr(self, "_out_keys"):
             self._out_keys = value
         self._out_keys_apparent = value
+        self._out_keys_mask = None
+
+    def _get_out_keys_mask(self) -> int:
+        # bit i is set if the i-th source out_key is in the current out_keys
+        mask = self._out_keys_mask
+        if mask is None:
+            selected = self.out_keys
+            mask = sum(
+                1 << i for i, key in enumerate(self._out_keys) if key in selected
+            )
+            self._out_keys_mask = mask
+        return mask
 
     def select_out_keys(self, *out_keys):
         """Selects the keys that will be found in the output tensordict.
@@ -568,6 +577,7 @@ class TensorDictModuleBase(nn.Module):
         for i, hook in list(self._forward_hooks.items()):
             if isinstance(hook, _OutKeysSelect):
                 del self._forward_hooks[i]
+        self._out_keys_mask = None
         return self
 
 
@@ -281,35 +281,34 @@ def _swap_state(
         raise Exception(f"{model}\nhas no stateless attribute.")
     model.__dict__["_is_stateless"] = is_stateless
     # return_old_tensordict = return_old_tensordict and not was_stateless
-    if old_tensordict is None:
+    if return_old_tensordict and old_tensordict is None:
         old_tensordict = {}
     keys = set(tensordict.keys())
-    children = []
     for key, child in model.named_children():
-        try:
-            keys.remove(key)
-        except KeyError:
-            # if params are built externally, this could lead to a KeyError as some
-            # modules do not have params
-            pass
-        children.append(key)
+        # if params are built externally, the key may be missing as some
+        # modules do not have params
+        keys.discard(key)
         value = tensordict.get(key, None)
         if value is None:
             # faster than get(key, Tensordict(...))
             value = {}
 
-        _old_value = old_tensordict.get(key, None)
-        _old_value = _swap_state(
-            child,
-            value,
-            return_old_tensordict=return_old_tensordict,
-            old_tensordict=_old_value,
-            is_stateless=is_stateless,
-        )
-        old_tensordict[key] = _old_value
+        if return_old_tensordict:
+            old_tensordict[key] = _swap_state(
+                child,
+                value,
+                return_old_tensordict=True,
+                old_tensordict=old_tensordict.get(key, None),
+                is_stateless=is_stateless,
+            )
+        else:
+            # nothing needs to be collected from the children
+            _swap_state(child, value, is_stateless=is_stateless)
+    if keys:
+        model_params = model.__dict__.get("_parameters")
     for key in keys:
         value = tensordict.get(key)
-        is_param = key in model.__dict__.get("_parameters")
+        is_param = key in model_params
         if return_old_tensordict:
             old_attr = getattr(model, key)
             if old_attr is None:
@@ -34,10 +34,12 @@ class InteractionType(Enum):
     @classmethod
     def from_str(cls, type_str: str) -> InteractionType:
         """Return the interaction_type with name matched to the provided string (case insensitive)."""
-        for member_type in cls:
-            if member_type.name == type_str.upper():
-                return member_type
-        raise ValueError(f"The provided interaction type {type_str} is unsupported!")
+        try:
+            return cls.__members__[type_str.upper()]
+        except KeyError as err:
+            raise ValueError(
+                f"The provided interaction type {type_str} is unsupported!"
+            ) from err
 
 
 _INTERACTION_TYPE: InteractionType | None = None
@@ -241,17 +241,22 @@ class set_skip_existing(_DecoratorContextManager):
 
         @functools.wraps(func)
         def wrapper(_self, tensordict, *args: Any, **kwargs: Any) -> Any:
-            in_keys = getattr(_self, self.in_key_attr)
-            out_keys = getattr(_self, self.out_key_attr)
-            # we use skip_existing to allow users to override the mode internally
-            if (
-                skip_existing()
-                and all(key in tensordict.keys(True) for key in out_keys)
-                and not any(key in out_keys for key in in_keys)
-            ):
-                return tensordict
+            # we use skip_existing to allow users to override the mode internally.
+            # The keys are only looked up when skipping is enabled.
+            if skip_existing():
+                in_keys = getattr(_self, self.in_key_attr)
+                out_keys = getattr(_self, self.out_key_attr)
+                td_keys = tensordict.keys(True)
+                if all(key in td_keys for key in out_keys) and not any(
+                    key in out_keys for key in in_keys
+                ):
+                    return tensordict
             return func(_self, tensordict, *args, **kwargs)
 
+        if self.mode is None:
+            # entering the context would leave the global value unchanged:
+            # the wrapper is returned as is
+            return wrapper
         return super().__call__(wrapper)
 
     def __enter__(self) -> None: